@@ -1,11 +1,28 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
 from flask_cors import CORS
+import ctypes
+import hashlib
+import json
+import orjson
 import pickle
+import joblib
 import numpy as np
-import pandas as pd
 import os
 import logging
 from datetime import datetime
+from functools import lru_cache
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import LabelEncoder
+from sklearn.tree import DecisionTreeRegressor
+from sklearn.tree._tree import NODE_DTYPE, Tree
+from training_options import (
+    READ_BUFFER_SIZE, build_training_data, load_cached_training_data, save_training_data_cache
+)
+
+try:
+    import treelite_runtime
+except ImportError:
+    treelite_runtime = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -15,41 +32,163 @@ app = Flask(__name__)
 app.secret_key = 'smartphone_price_prediction_secret_key_2024'
 CORS(app)
 
-# Load the training data to get actual options
+def add_lookup_sets(data_info):
+    """Add frozensets of the options for constant-time validation lookups"""
+    data_info['brands_set'] = frozenset(data_info['brands'])
+    data_info['storage_set'] = frozenset(data_info['storage_options'])
+    data_info['ram_set'] = frozenset(data_info['ram_options'])
+    data_info['warranty_set'] = frozenset(data_info['warranty_status'])
+    data_info['screen_set'] = frozenset(data_info['screen_conditions'])
+    data_info['body_set'] = frozenset(data_info['body_conditions'])
+    data_info['brand_models_set'] = {
+        brand: frozenset(names) for brand, names in data_info['brand_models'].items()
+    }
+    return data_info
+
+# Load the training data to get actual available options
 def load_training_data():
-    """Load the training data to get actual available options"""
-    try:
-        data_path = os.path.join('data', 'processed', 'resale.csv')
-        df = pd.read_csv(data_path)
-        
-        # Extract unique values for each feature
-        data_info = {
-            'brands': sorted(df['brand_name'].unique()),
-            'storage_options': sorted(df['storage'].unique()),
-            'ram_options': sorted(df['RAM'].unique()),
-            'warranty_status': sorted(df['warranty_status'].unique()),
-            'screen_conditions': sorted(df['screen_condition'].unique()),
-            'body_conditions': sorted(df['body_condition'].unique()),
-            'water_damage': [False, True],
-            'battery_health_range': {'min': int(df['battery_health'].min()), 'max': int(df['battery_health'].max())},
-            'core_feature_faulty': [False, True],
-            'has_full_kit': [False, True],
-            'age_range': {'min': int(df['age'].min()), 'max': int(df['age'].max())}
-        }
-        
-        # Get brand-specific models
-        brand_models = {}
-        for brand in data_info['brands']:
-            brand_models[brand] = sorted(df[df['brand_name'] == brand]['Name'].unique())
-        
-        data_info['brand_models'] = brand_models
-        
-        logger.info("Training data loaded successfully")
-        return data_info
+    """Load the training data options, normally from the cache written by
+    retrain_and_save_model.py; the CSV is only parsed when the cache is
+    missing or stale"""
+    data_info = load_cached_training_data()
+    if data_info is None:
+        data_info = build_training_data()
+        if data_info is None:
+            return None
+        save_training_data_cache(data_info)
+    
+    return add_lookup_sets(data_info)
+
+# Model files written by retrain_and_save_model.py
+FOREST_ARRAYS_PATH = os.path.join('models', 'final_model.npz')
+MODEL_PATH = os.path.join('models', 'final_model.joblib')
+LEGACY_MODEL_PATH = os.path.join('models', 'final_model.pkl')
+ENCODER_CLASSES_PATH = os.path.join('models', 'brand_encoder_classes.npy')
+ENCODER_PATH = os.path.join('models', 'brand_encoder.pkl')
+COMPILED_MODEL_PATH = os.path.join('models', 'final_model.so')
+C_MODEL_PATH = os.path.join('models', 'final_model_m2cgen.so')
+
+class TreeliteModel:
+    """Forest compiled by treelite, with the same predict interface as sklearn"""
+    
+    def __init__(self, path):
+        # Predict in the calling thread; a worker pool would not survive the
+        # fork of preloaded gunicorn workers and the gthread workers already
+        # provide the concurrency
+        self.predictor = treelite_runtime.Predictor(path, nthread=1, verbose=False)
+    
+    def predict(self, features):
+        # treelite squeezes single-row output to 0-d, so flatten it back
+        return self.predictor.predict(treelite_runtime.DMatrix(features)).reshape(-1)
+
+class CModel:
+    """Forest exported to C by m2cgen, called directly through ctypes"""
+    
+    def __init__(self, path):
+        self.score = ctypes.CDLL(path).score
+        self.score.argtypes = [np.ctypeslib.ndpointer(np.float64, ndim=1, flags='C_CONTIGUOUS')]
+        self.score.restype = ctypes.c_double
+    
+    def predict(self, features):
+        rows = np.ascontiguousarray(features, dtype=np.float64)
+        return np.array([self.score(row) for row in rows])
+
+def load_compiled_model(model_path):
+    """Load a compiled version of the model if one is available and up to date
+    
+    The m2cgen library is preferred since a direct C call has the lowest
+    overhead per row, then the treelite one when treelite is installed.
+    """
+    candidates = [(C_MODEL_PATH, CModel)]
+    if treelite_runtime is not None:
+        candidates.append((COMPILED_MODEL_PATH, TreeliteModel))
+    
+    for path, model_class in candidates:
+        if not os.path.exists(path):
+            continue
+        if os.path.getmtime(path) < os.path.getmtime(model_path):
+            logger.warning(f"Compiled model {path} is older than the saved model, ignoring it")
+            continue
+        
+        try:
+            compiled_model = model_class(path)
+            logger.info(f"Compiled model loaded successfully from {path}")
+            return compiled_model
+        except Exception as e:
+            logger.warning(f"Error loading compiled model {path}: {e}")
+    
+    return None
+
+def load_forest_arrays(path):
+    """Rebuild the random forest from the plain arrays saved by the retrain script
+    
+    The file is read with ``allow_pickle=False`` and each tree is restored
+    through sklearn's ``Tree`` state, so no pickled objects are executed.
+    """
+    with np.load(path, allow_pickle=False) as arrays:
+        n_features = int(arrays['n_features'])
+        tree_params = json.loads(str(arrays['tree_params']))
+        forest = RandomForestRegressor(**json.loads(str(arrays['forest_params'])))
+        node_counts = arrays['node_counts']
+        max_depths = arrays['max_depths']
+        values = arrays['value']
+        
+        # Node fields are stored separately, concatenated over all trees
+        nodes = np.empty(len(values), dtype=NODE_DTYPE)
+        for field in NODE_DTYPE.names:
+            nodes[field] = arrays[field]
+    
+    n_outputs = values.shape[1]
+    offsets = np.concatenate([[0], np.cumsum(node_counts)])
+    
+    estimators = []
+    for i, node_count in enumerate(node_counts):
+        start, end = offsets[i], offsets[i + 1]
+        tree = Tree(n_features, np.ones(n_outputs, dtype=np.intp), n_outputs)
+        tree.__setstate__({
+            'max_depth': int(max_depths[i]),
+            'node_count': int(node_count),
+            'nodes': nodes[start:end],
+            'values': values[start:end]
+        })
         
-    except Exception as e:
-        logger.error(f"Error loading training data: {e}")
-        return None
+        estimator = DecisionTreeRegressor(**tree_params)
+        estimator.tree_ = tree
+        estimator.n_features_in_ = n_features
+        estimator.n_outputs_ = n_outputs
+        estimators.append(estimator)
+    
+    forest.estimators_ = estimators
+    forest.n_features_in_ = n_features
+    forest.n_outputs_ = n_outputs
+    return forest
+
+def load_encoder_classes(path):
+    """Rebuild the brand encoder from its saved classes array"""
+    brand_encoder = LabelEncoder()
+    brand_encoder.classes_ = np.load(path, allow_pickle=False)
+    return brand_encoder
+
+def load_final_model():
+    """Load the final model from the first saved format that is available
+    
+    Returns the model and the path it was loaded from, or ``(None, None)``.
+    """
+    if os.path.exists(FOREST_ARRAYS_PATH):
+        try:
+            return load_forest_arrays(FOREST_ARRAYS_PATH), FOREST_ARRAYS_PATH
+        except Exception as e:
+            logger.warning(f"Error rebuilding model from arrays: {e}")
+    
+    if os.path.exists(MODEL_PATH):
+        # Memory-map the tree arrays instead of reading them into memory
+        return joblib.load(MODEL_PATH, mmap_mode='r'), MODEL_PATH
+    
+    if os.path.exists(LEGACY_MODEL_PATH):
+        with open(LEGACY_MODEL_PATH, 'rb', buffering=READ_BUFFER_SIZE) as f:
+            return pickle.load(f), LEGACY_MODEL_PATH
+    
+    return None, None
 
 # Load models and encoders
 def load_models():
@@ -57,14 +196,24 @@ def load_models():
     models = {}
     try:
         # Load the final model
-        if os.path.exists('models/final_model.pkl'):
-            with open('models/final_model.pkl', 'rb') as f:
-                models['final_model'] = pickle.load(f)
-            logger.info("Final model loaded successfully")
+        final_model, model_path = load_final_model()
+        if final_model is not None:
+            # Single-phone requests are too small to be worth a thread pool
+            final_model.n_jobs = 1
+            models['final_model'] = final_model
+            logger.info(f"Final model loaded successfully from {model_path}")
+            
+            # Prefer the compiled version of the same model for predictions
+            compiled_model = load_compiled_model(model_path)
+            if compiled_model is not None:
+                models['compiled_model'] = compiled_model
         
         # Load brand encoder
-        if os.path.exists('models/brand_encoder.pkl'):
-            with open('models/brand_encoder.pkl', 'rb') as f:
+        if os.path.exists(ENCODER_CLASSES_PATH):
+            models['brand_encoder'] = load_encoder_classes(ENCODER_CLASSES_PATH)
+            logger.info("Brand encoder loaded successfully")
+        elif os.path.exists(ENCODER_PATH):
+            with open(ENCODER_PATH, 'rb', buffering=READ_BUFFER_SIZE) as f:
                 models['brand_encoder'] = pickle.load(f)
             logger.info("Brand encoder loaded successfully")
             
@@ -74,41 +223,193 @@ def load_models():
     
     return models
 
+# Feature encoding shared by every prediction
+NUM_FEATURES = 12
+FEATURE_DTYPE = np.float32
+SCREEN_MAPPING = {'Good': 3, 'Scratched': 2, 'Cracked': 1}
+BODY_MAPPING = {'Good': 3, 'Scratched': 2, 'Damaged': 1}
+
+# Free list of (1, 12) feature buffers recycled across single predictions.
+# list.pop() and list.append() are atomic, so threads can share it safely;
+# it only grows to the number of requests handled concurrently
+feature_buffers = []
+
+def acquire_feature_buffer():
+    """Take a feature buffer from the free list, allocating one if it is empty"""
+    try:
+        return feature_buffers.pop()
+    except IndexError:
+        return np.empty((1, NUM_FEATURES), dtype=FEATURE_DTYPE)
+
+def release_feature_buffer(buffer):
+    """Return a feature buffer to the free list for the next request"""
+    feature_buffers.append(buffer)
+
+def predict_prices(features):
+    """Predict prices for a 2D feature array, using the compiled model if loaded"""
+    if 'compiled_model' in models:
+        return models['compiled_model'].predict(features)
+    return models['final_model'].predict(features)
+
 # Initialize data and models
 training_data = load_training_data()
 models = load_models()
 
+# Brand label codes as a plain dict; LabelEncoder.transform costs far more
+# per call than the rest of the feature preparation put together
+brand_codes = (
+    {brand: code for code, brand in enumerate(models['brand_encoder'].classes_.tolist())}
+    if 'brand_encoder' in models else {}
+)
+
+# Option responses never change while the app is running, so they are
+# serialized once and served with a strong ETag for conditional requests
+CACHE_CONTROL = 'public, max-age=86400'
+
+def prebuilt_json(obj):
+    """Serialize a response body once, together with its ETag"""
+    body = orjson.dumps(obj)
+    return body, hashlib.blake2b(body, digest_size=8).hexdigest()
+
+def build_options_json(data_info):
+    """Serialize the form options once so requests can reuse the bytes"""
+    return prebuilt_json({
+        'storage_options': data_info['storage_options'],
+        'ram_options': data_info['ram_options'],
+        'warranty_status': data_info['warranty_status'],
+        'screen_conditions': data_info['screen_conditions'],
+        'body_conditions': data_info['body_conditions'],
+        'water_damage': data_info['water_damage'],
+        'battery_health_range': data_info['battery_health_range'],
+        'core_feature_faulty': data_info['core_feature_faulty'],
+        'has_full_kit': data_info['has_full_kit'],
+        'age_range': data_info['age_range']
+    })
+
+BRANDS_JSON = prebuilt_json({'brands': training_data['brands']}) if training_data else None
+OPTIONS_JSON = build_options_json(training_data) if training_data else None
+
+@lru_cache(maxsize=None)
+def brand_models_json(brand):
+    """Serialize the models of a known brand, memoized per brand"""
+    return prebuilt_json({'models': training_data['brand_models'][brand]})
+
+def json_response(obj, status=200):
+    """Serialize a response body with orjson, which also handles numpy values"""
+    return Response(
+        orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY), status=status, mimetype='application/json'
+    )
+
+def cached_json_response(prebuilt):
+    """Return a prebuilt JSON body, or an empty 304 if the client has it already"""
+    body, etag = prebuilt
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
 @app.route('/api/brands')
 def get_brands():
     """Get available brands"""
     if training_data:
-        return jsonify({'brands': training_data['brands']})
-    return jsonify({'error': 'Training data not available'}), 500
+        return cached_json_response(BRANDS_JSON)
+    return json_response({'error': 'Training data not available'}, 500)
 
 @app.route('/api/models/<brand>')
 def get_models_for_brand(brand):
     """Get models for a specific brand"""
-    if training_data and brand in training_data['brand_models']:
-        return jsonify({'models': training_data['brand_models'][brand]})
-    return jsonify({'error': 'Brand not found'}), 404
+    if training_data and brand in training_data['brand_models_set']:
+        return cached_json_response(brand_models_json(brand))
+    return json_response({'error': 'Brand not found'}, 404)
 
 @app.route('/api/options')
 def get_all_options():
     """Get all available options for the form"""
     if training_data:
-        return jsonify({
-            'storage_options': training_data['storage_options'],
-            'ram_options': training_data['ram_options'],
-            'warranty_status': training_data['warranty_status'],
-            'screen_conditions': training_data['screen_conditions'],
-            'body_conditions': training_data['body_conditions'],
-            'water_damage': training_data['water_damage'],
-            'battery_health_range': training_data['battery_health_range'],
-            'core_feature_faulty': training_data['core_feature_faulty'],
-            'has_full_kit': training_data['has_full_kit'],
-            'age_range': training_data['age_range']
-        })
-    return jsonify({'error': 'Training data not available'}), 500
+        return cached_json_response(OPTIONS_JSON)
+    return json_response({'error': 'Training data not available'}, 500)
+
+# Fields every prediction request must provide
+REQUIRED_FIELDS = [
+    'brand', 'name', 'storage', 'ram', 'age',
+    'warranty_status', 'screen_condition', 'body_condition',
+    'water_damage', 'battery_health', 'core_feature_faulty', 'has_full_kit'
+]
+
+# Conversion of each raw request field to its typed value
+FIELD_CONVERTERS = {
+    'brand': lambda value: str(value).strip(),
+    'name': lambda value: str(value).strip(),
+    'storage': float,
+    'ram': float,
+    'age': int,
+    'warranty_status': lambda value: str(value).strip(),
+    'screen_condition': lambda value: str(value).strip(),
+    'body_condition': lambda value: str(value).strip(),
+    'water_damage': bool,
+    'battery_health': float,
+    'core_feature_faulty': bool,
+    'has_full_kit': bool
+}
+
+# Largest number of phones accepted by /predict_batch in one request
+MAX_BATCH_SIZE = 1024
+
+# Checks of the typed fields against the training data, applied in order.
+# Each entry pairs a check with a builder for its error message, so messages
+# are only formatted when a check fails
+FIELD_VALIDATORS = [
+    (lambda f, t: f['brand'] in t['brands_set'],
+     lambda f, t: f"Invalid brand: {f['brand']}"),
+    (lambda f, t: f['name'] in t['brand_models_set'].get(f['brand'], frozenset()),
+     lambda f, t: f"Invalid model for brand {f['brand']}: {f['name']}"),
+    (lambda f, t: f['storage'] in t['storage_set'],
+     lambda f, t: f"Invalid storage: {f['storage']}"),
+    (lambda f, t: f['ram'] in t['ram_set'],
+     lambda f, t: f"Invalid RAM: {f['ram']}"),
+    (lambda f, t: t['age_range']['min'] <= f['age'] <= t['age_range']['max'],
+     lambda f, t: f"Age must be between {t['age_range']['min']} and {t['age_range']['max']} months"),
+    (lambda f, t: f['warranty_status'] in t['warranty_set'],
+     lambda f, t: f"Invalid warranty status: {f['warranty_status']}"),
+    (lambda f, t: f['screen_condition'] in t['screen_set'],
+     lambda f, t: f"Invalid screen condition: {f['screen_condition']}"),
+    (lambda f, t: f['body_condition'] in t['body_set'],
+     lambda f, t: f"Invalid body condition: {f['body_condition']}"),
+    (lambda f, t: t['battery_health_range']['min'] <= f['battery_health'] <= t['battery_health_range']['max'],
+     lambda f, t: f"Battery health must be between {t['battery_health_range']['min']} and {t['battery_health_range']['max']}"),
+]
+
+def parse_prediction_input(data):
+    """Extract and validate one phone's features against the training data
+    
+    Returns ``(fields, None)`` on success, where ``fields`` holds the typed
+    values keyed like the ``prepare_features`` arguments, or ``(None, error)``.
+    """
+    if not isinstance(data, dict):
+        return None, 'Expected a JSON object'
+    
+    # Validate required fields
+    for field in REQUIRED_FIELDS:
+        if field not in data or data[field] in [None, '']:
+            return None, f'Missing required field: {field}'
+    
+    # Extract features, rejecting values that cannot be converted
+    fields = {}
+    for field, convert in FIELD_CONVERTERS.items():
+        try:
+            fields[field] = convert(data[field])
+        except (TypeError, ValueError, OverflowError):
+            return None, f'Invalid value for field: {field}'
+    
+    # Validate against actual training data
+    for check, error_message in FIELD_VALIDATORS:
+        if not check(fields, training_data):
+            return None, error_message(fields, training_data)
+    
+    return fields, None
 
 @app.route('/predict', methods=['POST'])
 def predict():
@@ -117,165 +418,152 @@ def predict():
         # Get form data
         data = request.get_json()
         
-        # Validate required fields
-        required_fields = [
-            'brand', 'name', 'storage', 'ram', 'age',
-            'warranty_status', 'screen_condition', 'body_condition',
-            'water_damage', 'battery_health', 'core_feature_faulty', 'has_full_kit'
-        ]
-        
-        for field in required_fields:
-            if field not in data or data[field] in [None, '']:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        # Extract and validate features
-        brand = str(data['brand']).strip()
-        name = str(data['name']).strip()
-        storage = float(data['storage'])
-        ram = float(data['ram'])
-        age = int(data['age'])
-        warranty_status = str(data['warranty_status']).strip()
-        screen_condition = str(data['screen_condition']).strip()
-        body_condition = str(data['body_condition']).strip()
-        water_damage = bool(data['water_damage'])
-        battery_health = float(data['battery_health'])
-        core_feature_faulty = bool(data['core_feature_faulty'])
-        has_full_kit = bool(data['has_full_kit'])
-        
-        # Validate against actual training data
         if not training_data:
-            return jsonify({'error': 'Training data not available'}), 500
-        
-        if brand not in training_data['brands']:
-            return jsonify({'error': f'Invalid brand: {brand}'}), 400
-        
-        if name not in training_data['brand_models'].get(brand, []):
-            return jsonify({'error': f'Invalid model for brand {brand}: {name}'}), 400
-        
-        if storage not in training_data['storage_options']:
-            return jsonify({'error': f'Invalid storage: {storage}'}), 400
-        
-        if ram not in training_data['ram_options']:
-            return jsonify({'error': f'Invalid RAM: {ram}'}), 400
-        
-        if age < training_data['age_range']['min'] or age > training_data['age_range']['max']:
-            return jsonify({'error': f'Age must be between {training_data["age_range"]["min"]} and {training_data["age_range"]["max"]} months'}), 400
-        
-        if warranty_status not in training_data['warranty_status']:
-            return jsonify({'error': f'Invalid warranty status: {warranty_status}'}), 400
+            return json_response({'error': 'Training data not available'}, 500)
         
-        if screen_condition not in training_data['screen_conditions']:
-            return jsonify({'error': f'Invalid screen condition: {screen_condition}'}), 400
+        fields, error = parse_prediction_input(data)
+        if error:
+            return json_response({'error': error}, 400)
         
-        if body_condition not in training_data['body_conditions']:
-            return jsonify({'error': f'Invalid body condition: {body_condition}'}), 400
-        
-        if battery_health < training_data['battery_health_range']['min'] or battery_health > training_data['battery_health_range']['max']:
-            return jsonify({'error': f'Battery health must be between {training_data["battery_health_range"]["min"]} and {training_data["battery_health_range"]["max"]}'}), 400
-        
-        # Prepare features for prediction
-        features = prepare_features(
-            brand, name, storage, ram, age, warranty_status, 
-            screen_condition, body_condition, water_damage, 
-            battery_health, core_feature_faulty, has_full_kit
-        )
-        
-        if features is None:
-            return jsonify({'error': 'Error preparing features for prediction'}), 500
-        
-        # Make prediction
-        if 'final_model' in models:
-            prediction = models['final_model'].predict(features.reshape(1, -1))[0]
-            confidence = calculate_confidence(features)
+        # Prepare features for prediction in a recycled buffer
+        features = acquire_feature_buffer()
+        try:
+            if prepare_features(**fields, out=features[0]) is None:
+                return json_response({'error': 'Error preparing features for prediction'}, 500)
             
-            # Format prediction
-            predicted_price = max(0, round(prediction, 2))
+            if 'final_model' not in models:
+                return json_response({'error': 'Model not available'}, 500)
             
-            return jsonify({
-                'success': True,
-                'predicted_price': predicted_price,
-                'confidence': confidence,
-                'features_used': {
-                    'brand': brand,
-                    'name': name,
-                    'storage': f"{storage} GB",
-                    'ram': f"{ram} GB",
-                    'age': f"{age} months",
-                    'warranty_status': warranty_status,
-                    'screen_condition': screen_condition,
-                    'body_condition': body_condition,
-                    'water_damage': water_damage,
-                    'battery_health': f"{battery_health}%",
-                    'core_feature_faulty': core_feature_faulty,
-                    'has_full_kit': has_full_kit
-                }
-            })
-        else:
-            return jsonify({'error': 'Model not available'}), 500
+            # Make prediction
+            prediction = predict_prices(features)[0]
+            confidence = calculate_confidence(features[0])
+        finally:
+            release_feature_buffer(features)
+        
+        # Format prediction
+        predicted_price = max(0, round(prediction, 2))
+        
+        return json_response({
+            'success': True,
+            'predicted_price': predicted_price,
+            'confidence': confidence,
+            'features_used': {
+                'brand': fields['brand'],
+                'name': fields['name'],
+                'storage': f"{fields['storage']} GB",
+                'ram': f"{fields['ram']} GB",
+                'age': f"{fields['age']} months",
+                'warranty_status': fields['warranty_status'],
+                'screen_condition': fields['screen_condition'],
+                'body_condition': fields['body_condition'],
+                'water_damage': fields['water_damage'],
+                'battery_health': f"{fields['battery_health']}%",
+                'core_feature_faulty': fields['core_feature_faulty'],
+                'has_full_kit': fields['has_full_kit']
+            }
+        })
             
     except Exception as e:
         logger.error(f"Prediction error: {e}")
-        return jsonify({'error': 'Internal server error during prediction'}), 500
+        return json_response({'error': 'Internal server error during prediction'}, 500)
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """Handle price prediction requests for a JSON array of phones
+    
+    All phones are predicted with a single model call, so batches of roughly
+    128 to 1024 phones amortize the per-call overhead best.
+    """
+    try:
+        items = request.get_json()
+        
+        if not isinstance(items, list) or not items:
+            return json_response({'error': 'Expected a non-empty JSON array of phones'}, 400)
+        
+        if len(items) > MAX_BATCH_SIZE:
+            return json_response({'error': f'Batch size must not exceed {MAX_BATCH_SIZE} phones'}, 400)
+        
+        if not training_data:
+            return json_response({'error': 'Training data not available'}, 500)
+        
+        if 'final_model' not in models:
+            return json_response({'error': 'Model not available'}, 500)
+        
+        # Validate every phone and fill its row of the batch feature array
+        features = np.empty((len(items), NUM_FEATURES), dtype=FEATURE_DTYPE)
+        for i, data in enumerate(items):
+            fields, error = parse_prediction_input(data)
+            if error:
+                return json_response({'error': f'Item {i}: {error}'}, 400)
+            if prepare_features(**fields, out=features[i]) is None:
+                return json_response({'error': f'Item {i}: Error preparing features for prediction'}, 500)
+        
+        predictions = predict_prices(features)
+        
+        return json_response({
+            'success': True,
+            'predictions': [
+                {
+                    'predicted_price': max(0, round(float(prediction), 2)),
+                    'confidence': calculate_confidence(row)
+                }
+                for prediction, row in zip(predictions, features)
+            ]
+        })
+        
+    except Exception as e:
+        logger.error(f"Batch prediction error: {e}")
+        return json_response({'error': 'Internal server error during prediction'}, 500)
 
 def prepare_features(brand, name, storage, ram, age, warranty_status, 
                     screen_condition, body_condition, water_damage, 
-                    battery_health, core_feature_faulty, has_full_kit):
-    """Prepare features for model prediction using actual training data structure"""
+                    battery_health, core_feature_faulty, has_full_kit, out=None):
+    """Prepare features for model prediction using actual training data structure
+    
+    The features are written into ``out``, a row of 12 values (for example one
+    row of a batch feature array), which is allocated when not given.
+    """
     try:
-        # Initialize feature array
-        features = []
+        if out is None:
+            out = np.empty(NUM_FEATURES, dtype=FEATURE_DTYPE)
         
         # 1. Storage (GB)
-        features.append(storage)
+        out[0] = storage
         
         # 2. RAM (GB)
-        features.append(ram)
+        out[1] = ram
         
         # 3. Age in months
-        features.append(age)
+        out[2] = age
         
         # 4. Screen condition (encoded)
-        screen_mapping = {'Good': 3, 'Scratched': 2, 'Cracked': 1}
-        features.append(screen_mapping.get(screen_condition, 2))
+        out[3] = SCREEN_MAPPING.get(screen_condition, 2)
         
         # 5. Body condition (encoded)
-        body_mapping = {'Good': 3, 'Scratched': 2, 'Damaged': 1}
-        features.append(body_mapping.get(body_condition, 2))
+        out[4] = BODY_MAPPING.get(body_condition, 2)
         
         # 6. Water damage (boolean to int)
-        features.append(1 if water_damage else 0)
+        out[5] = 1 if water_damage else 0
         
         # 7. Battery health (percentage)
-        features.append(battery_health)
+        out[6] = battery_health
         
         # 8. Core feature faulty (boolean to int)
-        features.append(1 if core_feature_faulty else 0)
+        out[7] = 1 if core_feature_faulty else 0
         
         # 9. Has full kit (boolean to int)
-        features.append(1 if has_full_kit else 0)
-        
-        # 10. Brand name encoded
-        if 'brand_encoder' in models:
-            try:
-                brand_encoded = models['brand_encoder'].transform([brand])[0]
-                features.append(brand_encoded)
-            except:
-                features.append(0)
-        else:
-            features.append(0)
+        out[8] = 1 if has_full_kit else 0
+        
+        # 10. Brand name encoded (unknown brands fall back to 0)
+        out[9] = brand_codes.get(brand, 0)
         
         # 11. Warranty status - Extended Warranty (one-hot encoded)
-        features.append(1 if warranty_status == 'Extended Warranty' else 0)
+        out[10] = 1 if warranty_status == 'Extended Warranty' else 0
         
         # 12. Warranty status - Out of Warranty (one-hot encoded)
-        features.append(1 if warranty_status == 'Out of Warranty' else 0)
+        out[11] = 1 if warranty_status == 'Out of Warranty' else 0
         
-        # Ensure we have exactly 12 features
-        if len(features) != 12:
-            logger.error(f"Expected 12 features, got {len(features)}")
-            return None
-            
-        return np.array(features)
+        return out
         
     except Exception as e:
         logger.error(f"Feature preparation error: {e}")
@@ -320,7 +608,7 @@ def health_check():
     """Health check endpoint"""
     model_status = 'final_model' in models
     data_status = training_data is not None
-    return jsonify({
+    return json_response({
         'status': 'healthy',
         'model_loaded': model_status,
         'training_data_loaded': data_status,
@@ -340,5 +628,6 @@ if __name__ == '__main__':
     port = 8501
     debug = False
     
+    # Development server only; production runs under gunicorn (gunicorn.conf.py)
     logger.info(f"Starting Smartphone Price Predictor on port {port}")
     app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,19 @@
+# Gunicorn configuration for serving the Flask backend in production
+# Usage: gunicorn -c gunicorn.conf.py app:app
+import multiprocessing
+
+bind = '0.0.0.0:8501'
+
+# Load the training data and models once in the master process; workers
+# inherit them through copy-on-write instead of each loading their own copy
+preload_app = True
+
+# Threaded workers: sklearn's tree prediction releases the GIL, so threads
+# share one copy of the forest and still predict concurrently
+worker_class = 'gthread'
+workers = multiprocessing.cpu_count() * 2 + 1
+threads = 4
+
+timeout = 30
+accesslog = '-'
+errorlog = '-'
@@ -1,12 +1,19 @@
 import pandas as pd
 import numpy as np
+import json
 import pickle
+import joblib
+import os
+import shutil
+import subprocess
+import tempfile
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import LabelEncoder
+from training_options import DATA_CACHE_PATH, DATA_PATH, build_training_data, save_training_data_cache
 
 # Load your training data
 # Adjust the path and columns as needed
-df = pd.read_csv('data/processed/resale.csv')
+df = pd.read_csv(DATA_PATH)
 
 # Encode categorical features
 brand_encoder = LabelEncoder()
@@ -41,16 +48,95 @@ X = df[features].values
 y = df['resale_price'].values
 
 # Train model
-model = RandomForestRegressor(n_estimators=100, random_state=42)
+# Depth and leaf size are bounded so the forest stays small on disk and in
+# memory, which keeps model loading and compiled-model builds fast
+model = RandomForestRegressor(
+    n_estimators=100, max_depth=16, min_samples_leaf=5, n_jobs=-1, random_state=42
+)
 model.fit(X, y)
 
-# Save model and encoders
-with open('models/final_model.pkl', 'wb') as f:
-    pickle.dump(model, f)
+# Save model and encoders. The model goes through joblib uncompressed so its
+# tree arrays are stored as raw buffers that app.py can memory-map on load
+joblib.dump(model, 'models/final_model.joblib', compress=0, protocol=pickle.HIGHEST_PROTOCOL)
 with open('models/brand_encoder.pkl', 'wb') as f:
-    pickle.dump(brand_encoder, f)
+    pickle.dump(brand_encoder, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+# Also save the forest and encoder as plain numpy arrays so app.py can rebuild
+# them without unpickling. Each node field and the leaf values are stored as
+# one array concatenated over all trees, split again using the node counts
+tree_params = model.estimators_[0].get_params()
+tree_params.pop('random_state')
+tree_states = [estimator.tree_.__getstate__() for estimator in model.estimators_]
+forest_arrays = {
+    'n_features': np.array(model.n_features_in_),
+    'forest_params': np.array(json.dumps(model.get_params(deep=False))),
+    'tree_params': np.array(json.dumps(tree_params)),
+    'node_counts': np.array([state['node_count'] for state in tree_states]),
+    'max_depths': np.array([state['max_depth'] for state in tree_states]),
+    'value': np.concatenate([state['values'] for state in tree_states]),
+}
+for field in tree_states[0]['nodes'].dtype.names:
+    forest_arrays[field] = np.concatenate([state['nodes'][field] for state in tree_states])
+np.savez('models/final_model.npz', **forest_arrays)
+np.save('models/brand_encoder_classes.npy', brand_encoder.classes_.astype(str))
+
+# Save the form options so app.py can load them without parsing the CSV,
+# reusing the DataFrame already loaded for training. This is done before the
+# optional compiled model exports below so it is never skipped by them
+training_options = build_training_data(df)
+if training_options is not None:
+    save_training_data_cache(training_options)
+    print(f'Training data options saved to {DATA_CACHE_PATH}')
+
+# Compile the forest into a native shared library when treelite is installed
+try:
+    import treelite
+    import treelite.sklearn
+except ImportError:
+    treelite = None
+
+if treelite is not None:
+    # The compiled model is optional, so a failed export (e.g. treelite 4.x,
+    # which moved export_lib to tl2cgen) must not abort retraining
+    try:
+        tl_model = treelite.sklearn.import_model(model)
+        tl_model.export_lib(toolchain='gcc', libpath='models/final_model.so', params={'parallel_comp': 4})
+        print('Compiled model saved to models/final_model.so')
+    except Exception as e:
+        print(f'treelite export failed ({e}), skipping compiled model export.')
+else:
+    print('treelite not installed, skipping compiled model export.')
+
+# Export the forest to C with m2cgen and compile it into a shared library
+# that app.py can call through ctypes without any extra runtime package
+try:
+    import m2cgen
+except ImportError:
+    m2cgen = None
+
+if m2cgen is not None and shutil.which('gcc'):
+    # The generated C source is only needed to build the library, so it is
+    # written to a temporary directory instead of being left in models/. Like
+    # the treelite export this is optional, so a failed code generation or
+    # compile is reported and skipped; app.py ignores the stale library
+    try:
+        with tempfile.TemporaryDirectory() as build_dir:
+            c_source_path = os.path.join(build_dir, 'final_model.c')
+            with open(c_source_path, 'w') as f:
+                f.write(m2cgen.export_to_c(model))
+            subprocess.run(
+                ['gcc', '-O3', '-shared', '-fPIC', c_source_path, '-o', 'models/final_model_m2cgen.so'],
+                check=True
+            )
+        print('C model saved to models/final_model_m2cgen.so')
+    except Exception as e:
+        print(f'C model export failed ({e}), skipping C model export.')
+else:
+    print('m2cgen or gcc not available, skipping C model export.')
 
 print('Model and encoders saved to models/.')
 print(f'Model trained with {len(features)} features: {features}')
 print(f'Training data shape: {X.shape}')
 print(f'Model score: {model.score(X, y):.4f}')
+print(f"Total tree nodes: {sum(est.tree_.node_count for est in model.estimators_)}")
+print(f"Model file size: {os.path.getsize('models/final_model.joblib') / 1e6:.1f} MB")
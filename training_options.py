@@ -0,0 +1,111 @@
+"""Available form options derived from the training data, and their cache
+
+The options are parsed from ``resale.csv`` by ``retrain_and_save_model.py`` and
+pickled to ``resale_info.pkl``, so the web app normally only unpickles them and
+never needs to import pandas.
+"""
+import importlib.util
+import logging
+import os
+import pickle
+
+logger = logging.getLogger(__name__)
+
+# Large read buffer for pickle files, which are read in many small chunks
+READ_BUFFER_SIZE = 1 << 20
+
+# Training data and the cache of options derived from it
+DATA_PATH = os.path.join('data', 'processed', 'resale.csv')
+DATA_CACHE_PATH = os.path.join('data', 'processed', 'resale_info.pkl')
+DATA_CACHE_VERSION = 3
+
+# Only the columns the options are derived from are parsed; the multithreaded
+# pyarrow CSV reader is used when pyarrow is installed
+DATA_COLUMNS = [
+    'brand_name', 'Name', 'storage', 'RAM', 'warranty_status',
+    'screen_condition', 'body_condition', 'battery_health', 'age'
+]
+CSV_ENGINE = 'pyarrow' if importlib.util.find_spec('pyarrow') else 'c'
+
+def load_cached_training_data():
+    """Load the cached training data options if they are newer than the CSV"""
+    try:
+        if not os.path.exists(DATA_CACHE_PATH):
+            return None
+        if os.path.exists(DATA_PATH) and os.path.getmtime(DATA_CACHE_PATH) < os.path.getmtime(DATA_PATH):
+            logger.info("Training data cache is stale, rebuilding from CSV")
+            return None
+        
+        with open(DATA_CACHE_PATH, 'rb', buffering=READ_BUFFER_SIZE) as f:
+            cache = pickle.load(f)
+        
+        if cache.get('version') != DATA_CACHE_VERSION:
+            logger.info("Training data cache is outdated, rebuilding from CSV")
+            return None
+        
+        logger.info("Training data loaded from cache")
+        return cache['data_info']
+        
+    except Exception as e:
+        logger.warning(f"Error loading training data cache: {e}")
+        return None
+
+def save_training_data_cache(data_info):
+    """Write the training data options to the cache for the next startup
+    
+    The cache is written to a temporary file in the same directory and then
+    renamed into place, so concurrently starting processes never read a
+    partially written cache.
+    """
+    temp_path = f'{DATA_CACHE_PATH}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            cache = {'version': DATA_CACHE_VERSION, 'data_info': data_info}
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, DATA_CACHE_PATH)
+        logger.info("Training data cache saved")
+    except Exception as e:
+        logger.warning(f"Error saving training data cache: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+# Parse the training data CSV into the available options
+def build_training_data(df=None):
+    """Build the available options from the training data CSV, or from an
+    already loaded DataFrame of it when one is given"""
+    try:
+        if df is None:
+            # Imported here so that loading the cached options does not pull in pandas
+            import pandas as pd
+            df = pd.read_csv(DATA_PATH, usecols=DATA_COLUMNS, engine=CSV_ENGINE)
+        
+        # Extract unique values for each feature as immutable tuples of plain
+        # Python values, shared as-is by every request
+        data_info = {
+            'brands': tuple(sorted(df['brand_name'].unique().tolist())),
+            'storage_options': tuple(sorted(df['storage'].unique().tolist())),
+            'ram_options': tuple(sorted(df['RAM'].unique().tolist())),
+            'warranty_status': tuple(sorted(df['warranty_status'].unique().tolist())),
+            'screen_conditions': tuple(sorted(df['screen_condition'].unique().tolist())),
+            'body_conditions': tuple(sorted(df['body_condition'].unique().tolist())),
+            'water_damage': (False, True),
+            'battery_health_range': {'min': int(df['battery_health'].min()), 'max': int(df['battery_health'].max())},
+            'core_feature_faulty': (False, True),
+            'has_full_kit': (False, True),
+            'age_range': {'min': int(df['age'].min()), 'max': int(df['age'].max())}
+        }
+        
+        # Get brand-specific models in a single pass over the data
+        brand_groups = df.groupby('brand_name', sort=True)['Name'].unique()
+        brand_models = {brand: tuple(sorted(names.tolist())) for brand, names in brand_groups.items()}
+        
+        data_info['brand_models'] = brand_models
+        
+        logger.info("Training data loaded successfully")
+        return data_info
+        
+    except Exception as e:
+        logger.error(f"Error loading training data: {e}")
+        return None